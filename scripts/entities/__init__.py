@@ -2,3 +2,5 @@ from .api_client import ApiClient
 from .mosaic import Mosaic
 from .processing import Processing
 from .project import Project
+from .store import Store
+from .workflow import Workflow
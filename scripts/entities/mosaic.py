@@ -1,10 +1,57 @@
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
+import requests
 from loguru import logger
 
 from .api_client import ApiClient
 
+COMPRESSIONS = ("deflate", "zstd")
+
+
+def compress_image(image_path: Path, directory: Path, compress: str = "deflate") -> Path:
+    """Rewrites the image as a losslessly compressed Cloud-Optimized GeoTIFF in `directory`.
+
+    Returns the path to the file that should be uploaded: the converted copy,
+    or the original image if conversion failed or did not make it smaller.
+    """
+    destination = directory / image_path.name
+    try:
+        # rasterio is only needed for compression, so the other commands work without it
+        import rasterio
+        from rasterio.shutil import copy as rio_copy
+
+        with rasterio.open(image_path) as src:
+            rio_copy(
+                src,
+                destination,
+                driver="COG",
+                compress=compress.upper(),
+                predictor="YES",
+                overviews="NONE",
+                bigtiff="IF_SAFER",
+            )
+    except Exception as e:
+        logger.warning(f"Failed to compress {image_path}, uploading it as is: {e}")
+        destination.unlink(missing_ok=True)
+        return image_path
+
+    original_size = image_path.stat().st_size
+    compressed_size = destination.stat().st_size
+    if compressed_size >= original_size:
+        logger.info(f"{image_path.name} is already compact, uploading it as is")
+        destination.unlink()
+        return image_path
+
+    logger.info(
+        f"Compressed {image_path.name}: {original_size / 2**20:.1f}MB -> {compressed_size / 2**20:.1f}MB"
+    )
+    return destination
+
 
 class Mosaic:
     def __init__(self, api_client: ApiClient = None, id: Optional[str] = None):
@@ -126,7 +173,65 @@ class Mosaic:
 
         return response
 
-    def upload_images(self, image_paths: list[Path], mosaic_id: Optional[str] = None):
+    def iter_upload_images(
+        self,
+        image_paths: list[Path],
+        mosaic_id: Optional[str] = None,
+        compress: Optional[str] = None,
+        workers: Optional[int] = None,
+    ) -> Iterator[tuple[Path, Optional[requests.Response]]]:
+        """Uploads images one by one, yielding `(image_path, response)` pairs.
+
+        With `compress`, the images are converted to COG in a process pool,
+        so the next images are being compressed while the current one is uploaded.
+        """
+        if not compress:
+            for image_path in image_paths:
+                yield image_path, self.upload_image(image_path, mosaic_id)
+            return
+
+        if not image_paths:
+            return
+
+        if compress not in COMPRESSIONS:
+            logger.error(f"Invalid compression: {compress}. Supported: {', '.join(COMPRESSIONS)}")
+            return
+
+        # No more processes than images: a forked process pool starts all of them at once
+        workers = min(max(workers or os.cpu_count() or 1, 1), len(image_paths))
+        with tempfile.TemporaryDirectory() as tmp_dir, ProcessPoolExecutor(max_workers=workers) as executor:
+            # Keep a bounded number of compressed files ahead of the upload
+            window = 2 * workers
+            pending = deque()
+            queue = iter(enumerate(image_paths))
+
+            def submit_next():
+                for index, image_path in queue:
+                    directory = Path(tmp_dir) / str(index)
+                    directory.mkdir()
+                    future = executor.submit(compress_image, image_path, directory, compress)
+                    pending.append((image_path, future))
+                    return
+
+            for _ in range(window):
+                submit_next()
+
+            while pending:
+                image_path, future = pending.popleft()
+                upload_path = future.result()
+                submit_next()
+                response = self.upload_image(upload_path, mosaic_id)
+                if upload_path != image_path:
+                    upload_path.unlink(missing_ok=True)
+                yield image_path, response
+
+    def upload_images(
+        self,
+        image_paths: list[Path],
+        mosaic_id: Optional[str] = None,
+        compress: Optional[str] = None,
+        workers: Optional[int] = None,
+    ):
         results = {
             "total": len(image_paths),
             "successful": 0,
@@ -134,8 +239,8 @@ class Mosaic:
             "failed_files": [],
         }
 
-        for image_path in image_paths:
-            if self.upload_image(image_path, mosaic_id):
+        for image_path, response in self.iter_upload_images(image_paths, mosaic_id, compress, workers):
+            if response:
                 results["successful"] += 1
             else:
                 results["failed"] += 1
@@ -147,7 +252,7 @@ class Mosaic:
 
         if not directory.exists():
             logger.error(f"No such directory {directory}")
-            return None
+            return []
 
         for ext in [".tif", ".tiff", ".TIF", ".TIFF"]:
             found_files = list(directory.glob(f"*{ext}"))
@@ -157,4 +262,4 @@ class Mosaic:
             return sorted(set(tiff_files))
         else:
             logger.warning(f"No images in directory {str(directory)}")
-        exit()
+            return []
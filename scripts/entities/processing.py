@@ -1,3 +1,4 @@
+from json import dumps
 from pathlib import Path
 from typing import Optional
 
@@ -5,6 +6,9 @@ from loguru import logger
 
 from .api_client import ApiClient
 
+# Processings in any other status won't change anymore
+IN_PROGRESS_STATUSES = ("UNPROCESSED", "IN_PROGRESS")
+
 
 class Processing:
     def __init__(self, api_client: ApiClient = None, id: Optional[str] = None):
@@ -76,7 +80,12 @@ class Processing:
         if not blocks:
             del _json["blocks"]
 
-        response = self.api_client.post("/processings/v2", json=_json)
+        # Compact separators noticeably shrink large AOI payloads
+        response = self.api_client.post(
+            "/processings/v2",
+            data=dumps(_json, separators=(",", ":")),
+            headers={"Content-Type": "application/json"},
+        )
 
         if response.status_code == 200:
             logger.info(f"Successfully created processing {response.json()['id']}")
@@ -128,7 +137,7 @@ class Processing:
             logger.error(f"Error when downloading results: {e}")
             return False
 
-    def get_wds(self):
+    def get_user_status(self):
         response = self.api_client.get("/user/status")
 
         if response.status_code == 200:
@@ -138,4 +147,23 @@ class Processing:
             logger.error(f"Error when getting user info: {_msg}")
             return None
 
+        return response
+
+    def get_wds(self):
+        response = self.get_user_status()
+        if not response:
+            return None
+
         return response.json()["models"]
+
+    def get_wd(self, wd_id: Optional[str] = None, wd_name: Optional[str] = None, models: Optional[list[dict]] = None):
+        models = models if models is not None else self.get_wds()
+        if not models:
+            return None
+
+        for model in models:
+            if model["id"] == wd_id or (not wd_id and model["name"] == wd_name):
+                return model
+
+        logger.error(f'No workflow definition found: "{wd_id or wd_name}"')
+        return None
@@ -0,0 +1,260 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from .api_client import ApiClient
+from .processing import IN_PROGRESS_STATUSES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mosaics (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    tags TEXT,
+    size_in_bytes INTEGER,
+    fingerprint TEXT,
+    data TEXT,
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    mosaic_id TEXT NOT NULL,
+    filename TEXT,
+    footprint TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS images_mosaic_id ON images (mosaic_id);
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    description TEXT,
+    fingerprint TEXT,
+    data TEXT,
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS processings (
+    id TEXT PRIMARY KEY,
+    project_id TEXT NOT NULL,
+    name TEXT,
+    status TEXT,
+    percent_completed INTEGER,
+    cost REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS processings_project_id ON processings (project_id);
+CREATE INDEX IF NOT EXISTS processings_status ON processings (status);
+CREATE TABLE IF NOT EXISTS processing_sources (
+    processing_id TEXT NOT NULL,
+    image_id TEXT,
+    mosaic_id TEXT
+);
+CREATE INDEX IF NOT EXISTS processing_sources_processing_id ON processing_sources (processing_id);
+CREATE INDEX IF NOT EXISTS processing_sources_image_id ON processing_sources (image_id);
+CREATE INDEX IF NOT EXISTS processing_sources_mosaic_id ON processing_sources (mosaic_id);
+"""
+
+
+class Store:
+    """Local SQLite mirror of the user's mosaics, images, projects and processings.
+
+    `sync` lists mosaics and projects (one request each) and fetches the images
+    or processings only for those whose summary changed since the last sync.
+    """
+
+    def __init__(self, api_client: ApiClient = None, db_path: Path = Path(".mapflow.sqlite")):
+        self.api_client = api_client
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def fingerprint(item: dict, keys: list[str]) -> str:
+        return json.dumps([item.get(key) for key in keys], sort_keys=True)
+
+    def fetch(self, endpoint: str, entity: str) -> Optional[list[dict]]:
+        # Mosaic and Project getters return None for empty lists, but an empty
+        # list is a valid state for the mirror, unlike an error
+        response = self.api_client.get(endpoint)
+        if response.status_code == 200:
+            return response.json()
+
+        _msg = f"{response.status_code} {response.reason} {response.text}"
+        logger.error(f"Error when getting {entity}: {_msg}")
+        return None
+
+    def sync(self, full: bool = False):
+        results = {"mosaics": self.sync_mosaics(full), "projects": self.sync_projects(full)}
+        logger.info("Local store successfully synced")
+        return results
+
+    def sync_mosaics(self, full: bool = False):
+        results = {"total": 0, "updated": 0, "removed": 0}
+        mosaics = self.fetch("/rasters/mosaic", "mosaics")
+        if mosaics is None:
+            return results
+
+        stored = {row["id"]: row["fingerprint"] for row in self.db.execute("SELECT id, fingerprint FROM mosaics")}
+
+        for _mosaic in mosaics:
+            results["total"] += 1
+            fingerprint = self.fingerprint(_mosaic, ["sizeInBytes", "updated"])
+            if not full and stored.get(_mosaic["id"]) == fingerprint:
+                continue
+
+            if _mosaic.get("sizeInBytes"):
+                images = self.fetch(f"/rasters/mosaic/{_mosaic['id']}/image", "images")
+                if images is None:
+                    # Keep the old fingerprint to retry on the next sync
+                    continue
+            else:
+                images = []
+
+            with self.db:
+                self.db.execute("DELETE FROM images WHERE mosaic_id = ?", (_mosaic["id"],))
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (img["id"], _mosaic["id"], img.get("filename"), img.get("footprint"), json.dumps(img))
+                        for img in images
+                    ],
+                )
+                self.db.execute(
+                    "INSERT OR REPLACE INTO mosaics VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        _mosaic["id"],
+                        _mosaic.get("name"),
+                        json.dumps(_mosaic.get("tags")),
+                        _mosaic.get("sizeInBytes"),
+                        fingerprint,
+                        json.dumps(_mosaic),
+                        time.time(),
+                    ),
+                )
+            results["updated"] += 1
+
+        removed = set(stored) - {_mosaic["id"] for _mosaic in mosaics}
+        with self.db:
+            for mosaic_id in removed:
+                self.db.execute("DELETE FROM images WHERE mosaic_id = ?", (mosaic_id,))
+                self.db.execute("DELETE FROM mosaics WHERE id = ?", (mosaic_id,))
+        results["removed"] = len(removed)
+
+        return results
+
+    def sync_projects(self, full: bool = False):
+        results = {"total": 0, "updated": 0, "removed": 0}
+        projects = self.fetch("/projects", "projects")
+        if projects is None:
+            return results
+
+        stored = {row["id"]: row["fingerprint"] for row in self.db.execute("SELECT id, fingerprint FROM projects")}
+        # Progress and cost of running processings change without changing project counters
+        running = {
+            row["project_id"]
+            for row in self.db.execute(
+                f"SELECT DISTINCT project_id FROM processings WHERE status IN ({', '.join('?' * len(IN_PROGRESS_STATUSES))})",
+                IN_PROGRESS_STATUSES,
+            )
+        }
+
+        for _project in projects:
+            results["total"] += 1
+            fingerprint = self.fingerprint(_project, ["processingCounts", "updated"])
+            if not full and stored.get(_project["id"]) == fingerprint and _project["id"] not in running:
+                continue
+
+            counts = _project.get("processingCounts")
+            if not isinstance(counts, dict) or any(counts.values()):
+                processings = self.fetch(f"/projects/{_project['id']}/processings", "project processings")
+                if processings is None:
+                    continue
+            else:
+                processings = []
+
+            with self.db:
+                self.delete_processings(_project["id"])
+                for _processing in processings:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO processings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            _processing["id"],
+                            _project["id"],
+                            _processing.get("name"),
+                            _processing.get("status"),
+                            _processing.get("percentCompleted"),
+                            _processing.get("cost"),
+                            json.dumps(_processing),
+                        ),
+                    )
+                    source = ((_processing.get("params") or {}).get("sourceParams") or {}).get("myImagery") or {}
+                    self.db.executemany(
+                        "INSERT INTO processing_sources VALUES (?, ?, ?)",
+                        [(_processing["id"], image_id, None) for image_id in source.get("imageIds") or []]
+                        + ([(_processing["id"], None, source["mosaicId"])] if source.get("mosaicId") else []),
+                    )
+                self.db.execute(
+                    "INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        _project["id"],
+                        _project.get("name"),
+                        _project.get("description"),
+                        fingerprint,
+                        json.dumps(_project),
+                        time.time(),
+                    ),
+                )
+            results["updated"] += 1
+
+        removed = set(stored) - {_project["id"] for _project in projects}
+        with self.db:
+            for project_id in removed:
+                self.delete_processings(project_id)
+                self.db.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+        results["removed"] = len(removed)
+
+        return results
+
+    def delete_processings(self, project_id: str):
+        self.db.execute(
+            "DELETE FROM processing_sources WHERE processing_id IN (SELECT id FROM processings WHERE project_id = ?)",
+            (project_id,),
+        )
+        self.db.execute("DELETE FROM processings WHERE project_id = ?", (project_id,))
+
+    def get_unprocessed_images(self) -> list[sqlite3.Row]:
+        """Images without an OK processing of the image itself or of its whole mosaic"""
+        return self.db.execute(
+            """
+            SELECT images.id, images.filename, images.mosaic_id, mosaics.name AS mosaic_name
+            FROM images
+            JOIN mosaics ON mosaics.id = images.mosaic_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM processing_sources
+                JOIN processings ON processings.id = processing_sources.processing_id
+                WHERE processing_sources.image_id = images.id AND processings.status = 'OK'
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM processing_sources
+                JOIN processings ON processings.id = processing_sources.processing_id
+                WHERE processing_sources.mosaic_id = images.mosaic_id AND processings.status = 'OK'
+            )
+            ORDER BY mosaics.name, images.filename
+            """
+        ).fetchall()
+
+    def get_project_costs(self) -> list[sqlite3.Row]:
+        return self.db.execute(
+            """
+            SELECT projects.id, projects.name, COUNT(processings.id) AS processings, COALESCE(SUM(processings.cost), 0) AS cost
+            FROM projects
+            LEFT JOIN processings ON processings.project_id = projects.id
+            GROUP BY projects.id
+            ORDER BY cost DESC
+            """
+        ).fetchall()
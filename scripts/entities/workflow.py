@@ -0,0 +1,355 @@
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import shapely
+import yaml
+from loguru import logger
+
+from ..utils.estimate import PREFLIGHT_MODES, estimate, get_limits, get_price, plan_batch
+from ..utils.geometry import prepare_aoi, read_aoi, read_footprints, to_geojson, wkt_to_geojson
+from .api_client import ApiClient
+from .mosaic import COMPRESSIONS, Mosaic
+from .processing import IN_PROGRESS_STATUSES, Processing
+
+
+class Workflow:
+    """Runs upload -> process -> watch -> download for every image of a job.
+
+    Stages overlap per image: the processing of an image is started as soon as
+    it is uploaded, while the next images are still uploading. Progress is
+    saved to the state file after each transition, so an interrupted job
+    resumes from where it stopped.
+    """
+
+    def __init__(self, api_client: ApiClient, job: dict, state_path: Path):
+        self.job = job
+        self.state_path = state_path
+        self.mosaic = Mosaic(api_client=api_client)
+        self.processing = Processing(api_client=api_client)
+        # Uploads run in their own thread, so they get their own session
+        self.upload_mosaic = Mosaic(
+            api_client=ApiClient(api_client.base_url, dict(api_client.session.headers))
+        )
+        self.state = self.load_state()
+        self.aoi = None
+        self.geometry = None
+
+    @staticmethod
+    def load_job(job_path: Path) -> Optional[dict]:
+        if not job_path.exists():
+            logger.error(f"No such file {job_path}")
+            return None
+
+        with open(job_path) as f:
+            if job_path.suffix.lower() == ".json":
+                return json.load(f)
+            return yaml.safe_load(f)
+
+    def load_state(self) -> dict:
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                logger.info(f"Resuming job from {self.state_path}")
+                return json.load(f)
+        return {"mosaic_id": None, "images": {}}
+
+    def save_state(self):
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        tmp_path.replace(self.state_path)
+
+    def get_mosaic_id(self) -> Optional[str]:
+        _mosaic = self.job.get("mosaic") or {}
+        mosaic_id = _mosaic.get("id") or self.state["mosaic_id"]
+        if not mosaic_id:
+            tags = _mosaic.get("tags")
+            if isinstance(tags, list):
+                tags = ", ".join(tags)
+            response = self.mosaic.create(_mosaic.get("name") or self.job.get("name", "workflow"), tags)
+            if not response:
+                return None
+            mosaic_id = response.json()["id"]
+
+        self.state["mosaic_id"] = mosaic_id
+        self.save_state()
+        return mosaic_id
+
+    def get_image_paths(self) -> list[Path]:
+        if not self.job.get("images"):
+            logger.error('"images" path is required in the job file!')
+            return []
+
+        path = Path(self.job["images"])
+        if path.is_file():
+            return [path]
+        return self.mosaic.find_tiff_files(path)
+
+    def get_aoi(self):
+        # The same AOI is used for every image, so it's prepared only once
+        if not self.aoi:
+            _processing = self.job["processing"]
+            aoi = read_aoi(Path(_processing["geometry"]))
+            if aoi:
+                aoi = prepare_aoi(aoi, _processing.get("simplify", 0.0), _processing.get("max_vertices"))
+            if not aoi:
+                return None
+            self.aoi = aoi
+            self.geometry = to_geojson(aoi)
+        return self.aoi
+
+    def get_geometry(self, image: dict) -> Optional[dict]:
+        if self.job["processing"].get("geometry"):
+            if not self.get_aoi():
+                return None
+            return self.geometry
+
+        footprint = image.get("footprint")
+        if not footprint:
+            _image = self.mosaic.get_image(image["id"])
+            if not _image:
+                return None
+            footprint = _image.json()["footprint"]
+        return wkt_to_geojson(footprint)
+
+    def get_blocks(self) -> Optional[list[dict]]:
+        options = self.job["processing"].get("options")
+        if not options:
+            return None
+        if isinstance(options, str):
+            options = options.split(", ")
+        return [{"name": block, "enabled": True} for block in options]
+
+    def start_processing(self, image_path: Path, image: dict):
+        _state = self.state["images"][str(image_path)]
+        _processing = self.job["processing"]
+
+        geometry = self.get_geometry(image)
+        if not geometry:
+            _state["status"] = "FAILED"
+            return
+
+        prefix = _processing.get("name")
+        response = self.processing.start(
+            f"{prefix}_{image_path.stem}" if prefix else image_path.stem,
+            image["id"],
+            wd_id=_processing.get("wd_id"),
+            wd_name=_processing.get("wd_name"),
+            geometry=geometry,
+            blocks=self.get_blocks(),
+            project_id=_processing.get("project_id"),
+            is_image=True,
+        )
+        if response:
+            _state["processing_id"] = response.json()["id"]
+            _state["status"] = "IN_PROGRESS"
+        else:
+            _state["status"] = "FAILED"
+
+    def watch(self, image_path: str):
+        _state = self.state["images"][image_path]
+        response = self.processing.get(_state["processing_id"])
+        if not response:
+            return
+
+        _processing = response.json()
+        _state["status"] = _processing["status"]
+        logger.info(f"{Path(image_path).name}: {_processing['status']} {_processing['percentCompleted']}%")
+        if _processing["status"] != "OK" and _processing["status"] not in IN_PROGRESS_STATUSES:
+            logger.error(f"{Path(image_path).name}: {_processing['status']} {_processing.get('messages')}")
+
+    def download(self, image_path: str):
+        _state = self.state["images"][image_path]
+        results_dir = Path(self.job.get("results", "."))
+        results_dir.mkdir(parents=True, exist_ok=True)
+
+        destination = results_dir / f"{Path(image_path).stem}.geojson"
+        if self.processing.download_result(destination, _state["processing_id"]):
+            _state["result"] = str(destination)
+        else:
+            _state["status"] = "DOWNLOAD_FAILED"
+
+    def preflight(self, image_paths: list[Path]) -> Optional[list[Path]]:
+        """Estimates the cost of the processings to be started and returns the images that fit"""
+        mode = self.job.get("preflight")
+        if not mode:
+            return image_paths
+
+        pending = [path for path in image_paths if not self.state["images"][str(path)].get("processing_id")]
+        if not pending:
+            return image_paths
+
+        user_status = self.processing.get_user_status()
+        if not user_status:
+            return None
+        user_status = user_status.json()
+
+        _processing = self.job["processing"]
+        wd = self.processing.get_wd(_processing.get("wd_id"), _processing.get("wd_name"), models=user_status["models"])
+        if not wd:
+            return None
+
+        geometries = read_footprints(pending)
+        if _processing.get("geometry"):
+            aoi = self.get_aoi()
+            if not aoi:
+                return None
+            # Each image is processed only within its own footprint
+            missing = shapely.is_missing(geometries)
+            geometries = shapely.intersection(aoi, geometries)
+            geometries[missing] = aoi
+
+        limits = get_limits(user_status)
+        items = estimate([str(path) for path in pending], geometries, get_price(wd, self.get_blocks()), limits)
+        accepted, rejected = plan_batch(items, limits, mode, self.job.get("max_cost"))
+        logger.info(f"Estimated cost of {len(accepted)} processings: {sum(item['cost'] for item in accepted):.2f}")
+
+        if rejected and mode == "reject":
+            logger.error(f"Job is rejected: {len(rejected)} of {len(pending)} processings don't fit the limits")
+            return None
+
+        for item in rejected:
+            self.state["images"][item["name"]]["status"] = "REJECTED"
+        self.save_state()
+        if rejected:
+            logger.warning(f"{len(rejected)} images are skipped to fit the limits")
+
+        rejected_paths = {item["name"] for item in rejected}
+        return [path for path in image_paths if str(path) not in rejected_paths]
+
+    def upload(self, image_paths: list[Path], mosaic_id: str, uploaded: queue.Queue):
+        try:
+            for image_path, response in self.upload_mosaic.iter_upload_images(
+                image_paths,
+                mosaic_id,
+                compress=self.job.get("compress"),
+                workers=self.job.get("workers"),
+            ):
+                uploaded.put((image_path, response))
+        finally:
+            uploaded.put(None)
+
+    def validate(self) -> bool:
+        _processing = self.job.get("processing")
+        if not isinstance(_processing, dict):
+            logger.error('"processing" section is required in the job file!')
+            return False
+
+        if not _processing.get("wd_id") and not _processing.get("wd_name"):
+            logger.error('"wd_id" or "wd_name" is required in the "processing" section!')
+            return False
+
+        compress = self.job.get("compress")
+        if compress and compress not in COMPRESSIONS:
+            logger.error(f"Invalid compression: {compress}. Supported: {', '.join(COMPRESSIONS)}")
+            return False
+
+        mode = self.job.get("preflight")
+        if mode and mode not in PREFLIGHT_MODES:
+            logger.error(f"Invalid preflight mode: {mode}. Supported: {', '.join(PREFLIGHT_MODES)}")
+            return False
+
+        return True
+
+    def run(self):
+        if not self.validate():
+            return
+
+        image_paths = self.get_image_paths()
+        if not image_paths:
+            return
+
+        for image_path in image_paths:
+            _state = self.state["images"].setdefault(str(image_path), {"image_id": None})
+            if _state.get("status") == "REJECTED":
+                del _state["status"]
+        self.save_state()
+
+        # Nothing is created on the platform until the whole batch is checked
+        image_paths = self.preflight(image_paths)
+        if image_paths is None:
+            return
+        if not image_paths:
+            return self.summary()
+
+        mosaic_id = self.get_mosaic_id()
+        if not mosaic_id:
+            return
+
+        # Retry what failed on our side in a previous run
+        for image_path in image_paths:
+            _state = self.state["images"][str(image_path)]
+            if _state.get("status") == "DOWNLOAD_FAILED":
+                _state["status"] = "OK"
+            if _state["image_id"] and not _state.get("processing_id"):
+                self.start_processing(image_path, {"id": _state["image_id"]})
+        self.save_state()
+
+        to_upload = [path for path in image_paths if not self.state["images"][str(path)]["image_id"]]
+        uploaded = queue.Queue()
+        uploader = threading.Thread(target=self.upload, args=(to_upload, mosaic_id, uploaded), daemon=True)
+        uploader.start()
+
+        poll_interval = self.job.get("poll_interval", 30)
+        uploading = True
+        next_poll = time.monotonic()
+        while True:
+            if uploading:
+                try:
+                    item = uploaded.get(timeout=max(0, next_poll - time.monotonic()))
+                except queue.Empty:
+                    item = ()
+
+                if item is None:
+                    uploading = False
+                elif item:
+                    image_path, response = item
+                    _state = self.state["images"][str(image_path)]
+                    if response:
+                        _state["image_id"] = response.json()["id"]
+                        self.start_processing(image_path, response.json())
+                    else:
+                        _state["status"] = "FAILED"
+                    self.save_state()
+                    continue
+
+            # Watch only what is known to be running, any other status is final
+            active = [
+                path
+                for path, _state in self.state["images"].items()
+                if _state.get("processing_id")
+                and not _state.get("result")
+                and (_state["status"] == "OK" or _state["status"] in IN_PROGRESS_STATUSES)
+            ]
+            if not uploading and not active:
+                break
+
+            delay = next_poll - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            for path in active:
+                if self.state["images"][path]["status"] != "OK":
+                    self.watch(path)
+                if self.state["images"][path]["status"] == "OK":
+                    self.download(path)
+            self.save_state()
+            next_poll = time.monotonic() + poll_interval
+
+        uploader.join()
+        return self.summary()
+
+    def summary(self) -> dict:
+        results = {"total": 0, "downloaded": 0, "rejected": 0, "failed": 0, "failed_files": []}
+        for path, _state in self.state["images"].items():
+            results["total"] += 1
+            if _state.get("result"):
+                results["downloaded"] += 1
+            elif _state.get("status") == "REJECTED":
+                results["rejected"] += 1
+            else:
+                results["failed"] += 1
+                results["failed_files"].append(path)
+        return results
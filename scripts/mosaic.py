@@ -5,6 +5,7 @@ from pathlib import Path
 from loguru import logger
 
 from .entities import ApiClient, Mosaic
+from .entities.mosaic import COMPRESSIONS
 
 api_client = ApiClient(
     base_url=os.getenv("BASE_URL"),
@@ -63,10 +64,28 @@ def upload_images(args: argparse.Namespace):
         logger.error("No such file or directory")
         return
 
-    if path.is_file():
+    if path.is_file() and not args.compress:
         mosaic.upload_image(path, args.mosaic_id)
-    else:
-        print(mosaic.upload_images(mosaic.find_tiff_files(path), args.mosaic_id))
+        return
+
+    image_paths = [path] if path.is_file() else mosaic.find_tiff_files(path)
+    if not image_paths:
+        return
+    print(
+        mosaic.upload_images(
+            image_paths,
+            args.mosaic_id,
+            compress=args.compress,
+            workers=args.workers,
+        )
+    )
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive number, got {value}")
+    return number
 
 
 def main():
@@ -76,6 +95,8 @@ def main():
     parser.add_argument('-t', '--tags', action='store', help='Mosaic tags with ", " separator. E.g: -t "tag1, tag2, ..."')
     parser.add_argument('-p', '--path', action='store', help='Path to the uploaded image or folder with images')
     parser.add_argument('--mosaic-id', action='store')
+    parser.add_argument('-c', '--compress', choices=COMPRESSIONS, help='Losslessly recompress images to COG before uploading')
+    parser.add_argument('-w', '--workers', type=positive_int, help='Number of compression processes. Defaults to the number of CPUs')
 
     args = parser.parse_args()
 
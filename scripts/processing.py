@@ -1,12 +1,13 @@
 import argparse
 import os
-from json import load, loads
 from pathlib import Path
 
 import shapely
 from loguru import logger
 
 from .entities import ApiClient, Mosaic, Processing
+from .utils.estimate import estimate, get_limits, get_price, plan_batch
+from .utils.geometry import prepare_aoi, read_aoi, to_geojson
 
 api_client = ApiClient(
     base_url=os.getenv("BASE_URL"),
@@ -69,68 +70,125 @@ def get_processing_status(args: argparse.Namespace):
         print("error: ", _processing["messages"])
 
 
-def start_processing(args: argparse.Namespace):
-    if not args.name:
-        logger.error('Processing "name" is not provided')
-        return
+def get_blocks(args: argparse.Namespace):
+    if not args.options:
+        return None
+    return [{"name": block, "enabled": True} for block in args.options.split(", ")]
 
-    if not args.image_id and not args.mosaic_id:
-        logger.error(
-            '"image-id" or "mosaic-id" is required, but nothing has been provided!'
-        )
-        return
 
-    if args.mosaic_id:
-        is_image = False
+def get_footprint(args: argparse.Namespace):
+    if args.image_id:
+        source = mosaic.get_image(args.image_id)
     else:
-        is_image = True
+        source = mosaic.get(args.mosaic_id)
+    if not source:
+        return None
+    return shapely.from_wkt(source.json()["footprint"])
 
-    if not args.wd_id and not args.wd_name:
-        logger.error('"wd-id" or "wd-name" is required, but nothing has been provided!')
-        return
-
-    if not args.options:
-        blocks = None
-    else:
-        blocks = [
-            {"name": block, "enabled": True} for block in args.options.split(", ")
-        ]
 
+def get_aoi(args: argparse.Namespace):
     if args.geometry:
         path = Path(args.geometry)
         if not path.exists():
             logger.error(f"No such file {path}")
-            return
+            return None
 
         if path.is_dir() or not path.suffix:
             logger.error(
                 "The path to the directory has been passed, only file paths are supported"
             )
-            return
+            return None
 
-        with open(path) as f:
-            geometry = load(f)["features"][0]["geometry"]
-    else:
-        if is_image:
-            image = mosaic.get_image(args.image_id)
-            if not image:
-                return
-            geometry = loads(shapely.to_geojson(shapely.from_wkt(image.json()["footprint"])))
+        aoi = read_aoi(path)
+        if not aoi:
+            return None
+        return prepare_aoi(aoi, tolerance=args.simplify, max_vertices=args.max_vertices)
+
+    return get_footprint(args)
+
+
+def check_source_args(args: argparse.Namespace) -> bool:
+    if not args.image_id and not args.mosaic_id:
+        logger.error(
+            '"image-id" or "mosaic-id" is required, but nothing has been provided!'
+        )
+        return False
+
+    if not args.wd_id and not args.wd_name:
+        logger.error('"wd-id" or "wd-name" is required, but nothing has been provided!')
+        return False
+
+    return True
+
+
+def preflight(args: argparse.Namespace, aoi) -> bool:
+    """Estimates the processing cost and checks it against the balance and AOI limit"""
+    user_status = processing.get_user_status()
+    if not user_status:
+        return False
+    user_status = user_status.json()
+
+    wd = processing.get_wd(args.wd_id, args.wd_name, models=user_status["models"])
+    if not wd:
+        return False
+
+    if args.geometry:
+        # Only the part of the AOI covered by the imagery is processed
+        footprint = get_footprint(args)
+        if footprint:
+            aoi = shapely.intersection(aoi, footprint)
         else:
-            _mosaic = mosaic.get(args.mosaic_id)
-            if not _mosaic:
-                return
-            geometry = loads(shapely.to_geojson(shapely.from_wkt(_mosaic.json()["footprint"])))
+            logger.warning("Unable to get the imagery footprint, the whole AOI is estimated")
+
+    limits = get_limits(user_status)
+    items = estimate([args.name or wd["name"]], [aoi], get_price(wd, get_blocks(args)), limits)
+    accepted, _ = plan_batch(items, limits, max_cost=args.max_cost)
+
+    unit = "km²" if limits["billing_type"] == "AREA" else "credits"
+    print(f"area: {items[0]['area']:.2f} km²")
+    print(f"cost: {items[0]['cost']:.2f} {unit}")
+    balance = limits["balance"]
+    print(f"balance: {'unlimited' if balance is None else f'{balance:.2f} {unit}'}")
+    return bool(accepted)
+
+
+def estimate_processing(args: argparse.Namespace):
+    if not check_source_args(args):
+        return
+
+    aoi = get_aoi(args)
+    if not aoi:
+        return
+
+    if not preflight(args, aoi):
+        logger.warning("The processing can't be started within the balance or AOI limit")
+
+
+def start_processing(args: argparse.Namespace):
+    if not args.name:
+        logger.error('Processing "name" is not provided')
+        return
+
+    if not check_source_args(args):
+        return
+
+    aoi = get_aoi(args)
+    if not aoi:
+        return
+
+    if args.preflight and not preflight(args, aoi):
+        logger.error("Processing is not started: it can't be done within the balance or AOI limit")
+        return
 
     processing.start(
         args.name,
         args.image_id or args.mosaic_id,
         wd_id=args.wd_id,
         wd_name=args.wd_name,
-        geometry=geometry,
-        blocks=blocks,
+        geometry=to_geojson(aoi),
+        blocks=get_blocks(args),
         project_id=args.project_id,
-        is_image=is_image,
+        is_image=not args.mosaic_id,
     )
 
 
@@ -141,13 +199,17 @@ def main():
     group.add_argument("--mosaic-id", action="store", help='Only "mosaic-id" or "image-id" can be provided')
     group.add_argument("--image-id", action="store", help='Only "image-id" or "mosaic-id" can be provided')
 
-    parser.add_argument("command", choices=["models", "start", "status", "download"])
+    parser.add_argument("command", choices=["models", "start", "estimate", "status", "download"])
     parser.add_argument("-n", "--name", action="store")
     parser.add_argument("--wd-id", action="store", help="Workflow definition ID")
     parser.add_argument("--wd-name", action="store", help="Workflow definition name (alternative to --wd-id)")
     parser.add_argument("--project-id", action="store", help="Processing will be created in the Deafault project if no other is provided")
     parser.add_argument("-o", "--options", action="store", help="[] if not provided")
     parser.add_argument("-g", "--geometry", action="store", help="Path to the geometry (AOI). If not provided - the footprint of the 'image' or 'mosaic' will be used automatically")
+    parser.add_argument("--simplify", type=float, default=0.0, help="AOI simplification tolerance in degrees. AOI is not simplified by default")
+    parser.add_argument("--max-vertices", type=int, help="Simplify the AOI until it has at most this number of vertices")
+    parser.add_argument("--preflight", action="store_true", help="Estimate the cost before the start and don't start the processing if it's over the balance or AOI limit")
+    parser.add_argument("--max-cost", type=float, help="Maximum cost allowed for the processing, in addition to the balance")
     parser.add_argument("--processing-id", action="store")
     parser.add_argument("-p", "--path", action="store", help="Path to download results")
 
@@ -165,6 +227,9 @@ def main():
     if args.command == "start":
         start_processing(args)
 
+    if args.command == "estimate":
+        estimate_processing(args)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,58 @@
+import argparse
+import os
+from pathlib import Path
+
+from .entities import ApiClient, Store
+
+api_client = ApiClient(
+    base_url=os.getenv("BASE_URL"),
+    default_headers={"Authorization": f"Basic {os.getenv('USER_TOKEN')}"},
+)
+
+
+def sync(store: Store, args: argparse.Namespace):
+    print(store.sync(full=args.full))
+
+
+def get_unprocessed_images(store: Store):
+    keys = ["id", "filename", "mosaic_id", "mosaic_name"]
+
+    for img in store.get_unprocessed_images():
+        for key in keys:
+            print(f"{key}: {img[key]}")
+        print()
+
+
+def get_project_costs(store: Store):
+    keys = ["id", "name", "processings", "cost"]
+
+    for _project in store.get_project_costs():
+        for key in keys:
+            print(f"{key}: {_project[key]}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mirror of mosaics, images, projects and processings")
+    parser.add_argument('command', choices=['sync', 'unprocessed', 'costs'])
+    parser.add_argument('--db', action='store', default='.mapflow.sqlite', help='Path to the local database. Default: ".mapflow.sqlite"')
+    parser.add_argument('--full', action='store_true', help='Re-fetch everything, not only what changed since the last sync')
+
+    args = parser.parse_args()
+
+    store = Store(api_client=api_client, db_path=Path(args.db))
+
+    if args.command == 'sync':
+        sync(store, args)
+
+    if args.command == 'unprocessed':
+        get_unprocessed_images(store)
+
+    if args.command == 'costs':
+        get_project_costs(store)
+
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
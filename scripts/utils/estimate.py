@@ -0,0 +1,98 @@
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from .geometry import area_km2
+
+PREFLIGHT_MODES = ("reject", "fit")
+
+
+def get_price(wd: dict, blocks: Optional[list[dict]] = None) -> float:
+    """Price of 1 km² for the model with the given optional blocks enabled"""
+    enabled = {block["name"] for block in blocks or [] if block.get("enabled")}
+    return (wd.get("pricePerSqKm") or 0) + sum(
+        block.get("price") or 0
+        for block in wd.get("blocks", [])
+        if block.get("optional") and block["name"] in enabled
+    )
+
+
+def get_limits(user_status: dict) -> dict:
+    """Remaining balance and AOI size limit from "/user/status".
+
+    With area billing the balance and the costs are measured in km²,
+    otherwise in credits. None means there is no limit.
+    """
+    billing_type = user_status.get("billingType", "CREDIT")
+    if billing_type == "NONE":
+        balance = None
+    elif billing_type == "AREA":
+        balance = (user_status.get("remainingArea") or 0) / 1e6
+    else:
+        balance = user_status.get("remainingCredits")
+
+    aoi_area_limit = user_status.get("aoiAreaLimit")
+    return {
+        "billing_type": billing_type,
+        "balance": balance,
+        "aoi_area_limit": aoi_area_limit / 1e6 if aoi_area_limit else None,
+    }
+
+
+def estimate(names: list[str], geometries, price: float, limits: dict) -> list[dict]:
+    areas = area_km2(geometries)
+    costs = areas if limits["billing_type"] == "AREA" else areas * price
+    return [
+        {"name": name, "area": float(area), "cost": float(cost)}
+        for name, area, cost in zip(names, areas, costs)
+    ]
+
+
+def plan_batch(
+    items: list[dict],
+    limits: dict,
+    mode: str = "reject",
+    max_cost: Optional[float] = None,
+) -> tuple[list[dict], list[dict]]:
+    """Splits the estimated processings into the ones to start and the rejected ones.
+
+    Processings with unknown or zero area, or above the AOI size limit, are always rejected.
+    If the total cost is over the balance (or `max_cost`), "reject" mode rejects
+    the whole batch, and "fit" mode starts the cheapest processings that fit.
+    """
+    accepted, rejected = [], []
+    for item in items:
+        if np.isnan(item["area"]):
+            logger.error(f'{item["name"]}: unknown area')
+            rejected.append(item)
+        elif item["area"] == 0:
+            logger.error(f'{item["name"]}: nothing to process, the AOI does not intersect the imagery')
+            rejected.append(item)
+        elif limits["aoi_area_limit"] and item["area"] > limits["aoi_area_limit"]:
+            logger.error(f'{item["name"]}: {item["area"]:.2f} km² is over the AOI limit of {limits["aoi_area_limit"]:.2f} km²')
+            rejected.append(item)
+        else:
+            accepted.append(item)
+
+    budgets = [budget for budget in (limits["balance"], max_cost) if budget is not None]
+    if not budgets:
+        return accepted, rejected
+    budget = min(budgets)
+
+    total = sum(item["cost"] for item in accepted)
+    if total <= budget:
+        return accepted, rejected
+
+    logger.warning(f"Estimated cost {total:.2f} is over the budget of {budget:.2f}")
+    if mode == "reject":
+        return [], rejected + accepted
+
+    fitting = []
+    for item in sorted(accepted, key=lambda item: item["cost"]):
+        if item["cost"] <= budget:
+            budget -= item["cost"]
+            fitting.append(item)
+        else:
+            rejected.append(item)
+    return fitting, rejected
@@ -0,0 +1,134 @@
+from json import dumps, load, loads
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import shapely
+from loguru import logger
+from shapely.errors import GEOSException
+
+POLYGONAL_TYPES = (3, 6)  # Polygon, MultiPolygon
+# ~1cm at the equator, finer than any imagery we process
+GRID_SIZE = 1e-7
+# Radius of the sphere with the same surface area as WGS84 ellipsoid, meters
+AUTHALIC_RADIUS = 6371007.2
+
+
+def to_geojson(geometry: shapely.Geometry) -> dict:
+    return loads(shapely.to_geojson(geometry))
+
+
+def wkt_to_geojson(wkt: str) -> dict:
+    return to_geojson(shapely.from_wkt(wkt))
+
+
+def read_aoi(path: Path) -> Optional[shapely.Geometry]:
+    """Reads the first feature of a GeoJSON file, like the API expects the AOI"""
+    try:
+        with open(path) as f:
+            data = load(f)
+        if data.get("type") == "FeatureCollection":
+            data = data["features"][0]
+        if data.get("type") == "Feature":
+            data = data["geometry"]
+        # Only the used geometry is parsed by GEOS, the other features may be anything
+        geometry = shapely.from_geojson(dumps(data)) if data else None
+    except (OSError, ValueError, KeyError, IndexError, AttributeError, GEOSException) as e:
+        logger.error(f"Failed to read geometry from {path}: {e}")
+        return None
+
+    if geometry is None or shapely.is_empty(geometry):
+        logger.error(f"No geometry in {path}")
+        return None
+    return geometry
+
+
+def prepare_aoi(
+    geometry: shapely.Geometry,
+    tolerance: float = 0.0,
+    max_vertices: Optional[int] = None,
+) -> Optional[shapely.Geometry]:
+    """Makes the AOI valid and polygonal, then reduces its vertex count.
+
+    Simplifies with `tolerance` (in degrees), increasing it until the AOI has
+    at most `max_vertices`, and snaps the coordinates to GRID_SIZE to shorten
+    the request body.
+    """
+    parts = shapely.get_parts(shapely.make_valid(geometry))
+    parts = parts[np.isin(shapely.get_type_id(parts), POLYGONAL_TYPES)]
+    if not len(parts):
+        logger.error("AOI has no area")
+        return None
+    geometry = shapely.union_all(parts)
+
+    original_vertices = shapely.get_num_coordinates(geometry)
+    if tolerance:
+        geometry = shapely.simplify(geometry, tolerance, preserve_topology=True)
+
+    if max_vertices and shapely.get_num_coordinates(geometry) > max_vertices:
+        xmin, ymin, xmax, ymax = shapely.bounds(geometry)
+        # Rings can't be simplified further than a few vertices, so the AOI size is the upper bound
+        low, high = max(tolerance, GRID_SIZE), max(xmax - xmin, ymax - ymin, GRID_SIZE)
+        simplified = shapely.simplify(geometry, high, preserve_topology=True)
+        count = shapely.get_num_coordinates(simplified)
+        if count > max_vertices:
+            # Simplifying that much would wipe out the AOI, so keep it as requested
+            logger.warning(
+                f"Unable to simplify AOI to {max_vertices} vertices, keeping {shapely.get_num_coordinates(geometry)}"
+            )
+        else:
+            # Find the smallest tolerance that fits, to keep as much detail as allowed.
+            # Tolerances span orders of magnitude, so bisect them geometrically and stop
+            # once the vertex count can't get closer to the budget
+            low_count = shapely.get_num_coordinates(geometry)
+            while count < max_vertices and low_count - count > 1 and high / low > 1.01:
+                middle = (low * high) ** 0.5
+                candidate = shapely.simplify(geometry, middle, preserve_topology=True)
+                candidate_count = shapely.get_num_coordinates(candidate)
+                if candidate_count > max_vertices:
+                    low, low_count = middle, candidate_count
+                else:
+                    high, simplified, count = middle, candidate, candidate_count
+            geometry = simplified
+
+    geometry = shapely.set_precision(geometry, GRID_SIZE)
+    vertices = shapely.get_num_coordinates(geometry)
+    if vertices != original_vertices:
+        logger.info(f"AOI simplified: {original_vertices} -> {vertices} vertices")
+    return geometry
+
+
+def _to_equal_area(coords: np.ndarray) -> np.ndarray:
+    # Lambert cylindrical equal-area projection
+    lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    return np.column_stack((AUTHALIC_RADIUS * lon, AUTHALIC_RADIUS * np.sin(lat)))
+
+
+def area_km2(geometries) -> np.ndarray:
+    """Areas of WGS84 geometries in km², computed for the whole array at once"""
+    return shapely.area(shapely.transform(np.asarray(geometries), _to_equal_area)) / 1e6
+
+
+def read_footprints(image_paths: list[Path]) -> np.ndarray:
+    """WGS84 bounding boxes of local images, None for images without georeference"""
+    bounds = np.full((len(image_paths), 4), np.nan)
+    try:
+        # rasterio is optional for the commands that don't read local images
+        import rasterio
+        from rasterio.warp import transform_bounds
+    except ImportError:
+        logger.warning("rasterio is not installed, unable to read image footprints")
+        return np.full(len(image_paths), None, dtype=object)
+
+    for i, image_path in enumerate(image_paths):
+        try:
+            with rasterio.open(image_path) as src:
+                if src.crs:
+                    bounds[i] = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+        except Exception as e:
+            logger.warning(f"Failed to read footprint of {image_path}: {e}")
+
+    footprints = np.full(len(image_paths), None, dtype=object)
+    valid = ~np.isnan(bounds).any(axis=1)
+    footprints[valid] = shapely.box(*bounds[valid].T)
+    return footprints
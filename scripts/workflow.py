@@ -0,0 +1,42 @@
+import argparse
+import os
+from pathlib import Path
+
+from loguru import logger
+
+from .entities import ApiClient, Workflow
+
+api_client = ApiClient(
+    base_url=os.getenv("BASE_URL"),
+    default_headers={"Authorization": f"Basic {os.getenv('USER_TOKEN')}"},
+)
+
+
+def run_workflow(args: argparse.Namespace):
+    if not args.job:
+        logger.error('Path to the "job" file is required!')
+        return
+
+    job_path = Path(args.job)
+    job = Workflow.load_job(job_path)
+    if not job:
+        return
+
+    state_path = Path(args.state) if args.state else job_path.with_suffix(".state.json")
+    print(Workflow(api_client, job, state_path).run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload, process and download imagery in one job")
+    parser.add_argument('command', choices=['run'])
+    parser.add_argument('-j', '--job', action='store', help='Path to the .yaml or .json job file')
+    parser.add_argument('-s', '--state', action='store', help='Path to the job state file. Defaults to "<job>.state.json" next to the job file')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run_workflow(args)
+
+
+if __name__ == '__main__':
+    main()